@@ -8,6 +8,13 @@ Expects configuration file: bigjob_azure.conf in directory of python executable
 Use template: bigjob_azure.conf.template for reference
 cp bigjob_azure.conf.template bigjob_azure.conf
 
+Optionally (COMPLETION_QUEUE=True in the configuration file), the states of 
+finished subjobs are taken from a completion queue of the bigjob 
+(<application name>-<bigjob uuid>-done) holding messages "<job_id>:<state>". The agent in this tree does not write to 
+this queue yet, so it is disabled by default. If enabled, the blob of a subjob 
+that has not reported its completion is re-read only every 
+COMPLETION_FALLBACK_TIMEOUT seconds.
+
 """
 
 import sys
@@ -17,14 +24,21 @@ sys.path.append(os.path.dirname( __file__ ) + "/winazurestorage/")
 import getopt
 import time
 import uuid
+import itertools
 import pdb
 import socket
 import traceback
-import json
+# use faster ujson implementation if available
+try:
+    import ujson as json
+except ImportError:
+    import json
 import ConfigParser
 
 # multiprocessing
 import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../ext/threadpool-1.2.7/src/")
+from threadpool import *
 #from multiprocessing import Process, Pool, Lock
 #from multiprocessing.sharedctypes import Value, Array
 
@@ -46,23 +60,65 @@ APPLICATION_NAME="bigjob"
 STATE = "state"
 JOB_DESCRIPTION = "jd"
 NODE_FILE = "nodefile"
+""" Suffix of the per-bigjob queue used to report finished subjobs """
+COMPLETION_QUEUE_SUFFIX = "-done"
 
 CONFIG_FILE="bigjob_azure.conf"
 
+""" Number of concurrent blob requests used for querying subjob states """
+STATE_QUERY_THREADS=64
+""" Time in seconds for which a queried subjob state is reused """
+STATE_CACHE_TTL=2
+""" Time in seconds after which the blob of a subjob that has not reported via 
+    the completion queue is re-read (only used if the completion queue is enabled) """
+COMPLETION_FALLBACK_TIMEOUT=60
+
+
+""" Configuration and storage clients shared by all bigjob_azure instances """
+_config_defaults = None
+_storage_clients = None
+_storage_lock = threading.Lock()
 
+def get_config_defaults():
+    """ returns the defaults of the configuration file (read only once) """
+    global _config_defaults
+    _storage_lock.acquire()
+    try:
+        if _config_defaults == None:
+            conf_file =  os.path.dirname( __file__ ) + "/" + CONFIG_FILE
+            logging.debug("read config file: %s", conf_file)
+            config = ConfigParser.ConfigParser()
+            config.read(conf_file)
+            _config_defaults = config.defaults()
+        return _config_defaults
+    finally:
+        _storage_lock.release()
 
+def get_storage_clients():
+    """ returns the shared (BlobStorage, QueueStorage) clients (created only once) """
+    global _storage_clients
+    default_dict = get_config_defaults()
+    _storage_lock.acquire()
+    try:
+        if _storage_clients == None:
+            logging.debug("init azure storage: blob and queue") 
+            blob = BlobStorage(host = "blob.core.windows.net", 
+                               account_name = default_dict["account_name_storage"], 
+                               secret_key = default_dict["secret_key"])
+            queue = QueueStorage(host = "queue.core.windows.net", 
+                                 account_name = default_dict["account_name_storage"], 
+                                 secret_key = default_dict["secret_key"])
+            _storage_clients = (blob, queue)
+        return _storage_clients
+    finally:
+        _storage_lock.release()
 
 
 class bigjob_azure():
     
     def __init__(self, database_host=None):
         
-        # read config file
-        conf_file =  os.path.dirname( __file__ ) + "/" + CONFIG_FILE
-        logging.debug("read config file: " + conf_file)
-        config = ConfigParser.ConfigParser()
-        config.read(conf_file)
-        default_dict = config.defaults()
+        default_dict = get_config_defaults()
         self.account_name_storage = default_dict["account_name_storage"]
         self.account_names_compute = default_dict["account_names_compute"]
         self.slot = default_dict["slot"]
@@ -74,26 +130,36 @@ class bigjob_azure():
         self.service_package = default_dict["service_package"]
         self.service_configuration = os.path.dirname(__file__) +"/"+default_dict["service_configuration"]
                 
-        logging.debug("init azure storage: blob and queue") 
         self.uuid = str(uuid.uuid1())        
+        # subjob ids are unique within this bigjob: subjob-<uuid>-<counter>
+        self.subjob_counter = itertools.count()
         self.app_id = APPLICATION_NAME
-        self.blob = BlobStorage(host = "blob.core.windows.net", 
-                             account_name = self.account_name_storage, 
-                             secret_key = self.secret_key)
+        self.blob, self.queue = get_storage_clients()
         result = self.blob.create_container(self.app_id)
-        logging.debug("Result of pilot job blob container creation: " + str(result))
-        
-        self.queue = QueueStorage(host = "queue.core.windows.net", 
-                             account_name = self.account_name_storage, 
-                             secret_key = self.secret_key)
+        logging.debug("Result of pilot job blob container creation: %s", result)
         
         result = self.queue.create_queue(self.app_id)
-        logging.debug("Result of pilot job queue creation: " + str(result))
+        logging.debug("Result of pilot job queue creation: %s", result)
+        
+        self.completion_queue = None
+        if default_dict.get("completion_queue", "False").lower() == "true":
+            # one queue per bigjob: instances sharing the storage account must not 
+            # consume the completion messages of each other
+            self.completion_queue = self.app_id + "-" + self.uuid + COMPLETION_QUEUE_SUFFIX
+            result = self.queue.create_queue(self.completion_queue)
+            logging.debug("Result of completion queue creation: %s", result)
+        # states of finished subjobs reported via the completion queue
+        self.finished_subjobs = {}
+        # recently queried subjob states: job_id => (state, query time, etag)
+        self.state_cache = {}
         
         self.app_url=self.blob.get_base_url()+"/"+self.app_id
-        logging.debug("created azure blob: " + self.app_url)
+        logging.debug("created azure blob: %s", self.app_url)
         
         self.stopped = False
+        
+        # thread pool for concurrent subjob state queries (created on first use)
+        self.threadpool = None
     
     def start_azure_worker_roles(self, number=1):
         self.stopped = False
@@ -120,7 +186,7 @@ class bigjob_azure():
               
            
     def start_single_azure_worker_role(self, service_name, number, slot, service_package, service_configuration):
-        logging.debug("Initiate service: " + service_name + " number instances: " + str(number))
+        logging.debug("Initiate service: %s number instances: %s", service_name, number)
         hostedService = HostedService(self.subscription_id, self.user_certificate); 
         requestId = hostedService.createDeployment(service_name, APPLICATION_NAME, slot, 
                        service_package, 
@@ -151,7 +217,7 @@ class bigjob_azure():
     def stop_azure_worker_roles(self):        
         if self.stopped == False:
             for service_name in self.account_names_compute.split():
-                logging.debug("Deleting deployment for service: " + service_name)
+                logging.debug("Deleting deployment for service: %s", service_name)
                 hostedService = HostedService(self.subscription_id, self.user_certificate); 
                 requestId = hostedService.updateDeploymentStatus(service_name, self.slot, "Suspended")
                 status = hostedService.waitForRequest(requestId)
@@ -180,7 +246,7 @@ class bigjob_azure():
         #update state blob
         #self.blob.put_blob(self.app_id, STATE, str(state.Unknown), "text/plain")
         self.set_state(str(state.Unknown))
-        logging.debug("set pilot state to: " + str(state.Unknown))
+        logging.debug("set pilot state to: %s", state.Unknown)
  
         # use service management api to spawn azure images
         logging.debug("init azure worker roles") 
@@ -206,11 +272,16 @@ class bigjob_azure():
         self.stop_azure_worker_roles()
         self.blob.delete_container(self.app_id)
         self.queue.delete_queue(self.app_id);
+        if self.completion_queue != None:
+            self.queue.delete_queue(self.completion_queue)
+        if self.threadpool != None:
+            self.threadpool.dismissWorkers(len(self.threadpool.workers), do_join=True)
+            self.threadpool = None
         
         
     def add_subjob(self, jd):
         logging.debug("add subjob to queue")
-        job_id = "subjob-" + str(uuid.uuid1())
+        job_id = "subjob-%s-%d"%(self.uuid, self.subjob_counter.next())
         # handle file staging
         if (len(jd.filetransfer)>0):
             self.stage_in_files(job_id, jd.filetransfer)
@@ -221,8 +292,8 @@ class bigjob_azure():
         result1 = self.blob.put_blob(self.app_id, job_id, json_jd, "text/plain")
         # create queue message for subjob
         result2 = self.queue.put_message(self.app_id, job_id)
-        logging.debug ("Results: subjob blob creation: " +str(result1) 
-                       + " subjob queue message: " + str(result2))
+        logging.debug("Results: subjob blob creation: %s subjob queue message: %s", 
+                      result1, result2)
         return job_id 
 
     
@@ -239,10 +310,81 @@ class bigjob_azure():
                 fd.close()     
        
      
-    def get_subjob_state(self, job_id):
-        json_jd = self.blob.get_blob(self.app_id, job_id)  
-        jd_dict = json.loads(json_jd)
-        return jd_dict["state"]
+    def get_subjob_state(self, job_id, max_age=STATE_CACHE_TTL):
+        """ returns the state of the subjob; a state queried less than 
+            max_age seconds ago is returned without accessing the blob """
+        if job_id in self.finished_subjobs:
+            return self.finished_subjobs[job_id]
+        etag = None
+        if job_id in self.state_cache:
+            cached_state, query_time, etag = self.state_cache[job_id]
+            if time.time()-query_time < max_age:
+                return cached_state
+        # conditional get: an unchanged blob is answered with 304 and no body
+        json_jd, etag = self.blob.get_blob_if_none_match(self.app_id, job_id, etag)  
+        if json_jd == None:
+            subjob_state = cached_state
+        else:
+            subjob_state = json.loads(json_jd)["state"]
+        self.state_cache[job_id] = (subjob_state, time.time(), etag)
+        return subjob_state
+    
+    def drain_completion_queue(self):
+        """ retrieves all completion messages ("<job_id>:<state>") from the completion queue 
+            messages of subjobs of other bigjobs are not deleted (they become visible again) """
+        if self.completion_queue == None:
+            return
+        job_id_prefix = "subjob-%s-"%self.uuid
+        while True:
+            messages = self.queue.get_messages(self.completion_queue, numofmessages=32, visibilitytimeout=30)
+            if len(messages)==0:
+                break
+            for message in messages:
+                job_id, sep, job_state = message.text.strip().rpartition(":")
+                if not job_id.startswith(job_id_prefix):
+                    continue
+                if sep != "":
+                    self.finished_subjobs[job_id] = job_state
+                self.queue.delete_message(self.completion_queue, message)
+    
+    def get_all_subjob_states(self, job_ids):
+        """ returns dictionary job_id => state for the specified subjobs
+            the blobs of the subjobs are read concurrently via the thread pool;
+            if the completion queue is enabled, states of finished subjobs are 
+            taken from the queue and the blobs of all other subjobs are only read 
+            every COMPLETION_FALLBACK_TIMEOUT seconds """
+        max_age = STATE_CACHE_TTL
+        if self.completion_queue != None:
+            self.drain_completion_queue()
+            max_age = COMPLETION_FALLBACK_TIMEOUT
+        states = {}
+        for job_id in job_ids:
+            if job_id in self.finished_subjobs:
+                states[job_id] = self.finished_subjobs[job_id]
+        def store_state(request, result):
+            states[request.args[0]] = result
+        def store_unknown(request, exc_info):
+            logging.error("Retrieval of state for subjob %s failed: %s", request.args[0], exc_info[1])
+            states[request.args[0]] = str(state.Unknown)
+        pending_job_ids = [job_id for job_id in job_ids if job_id not in states]
+        if len(pending_job_ids) == 0:
+            return states
+        threadpool = self.__get_threadpool(len(pending_job_ids))
+        for job_id in pending_job_ids:
+            threadpool.putRequest(WorkRequest(self.get_subjob_state, [job_id, max_age], 
+                                              callback=store_state, exc_callback=store_unknown))
+        threadpool.wait()
+        return states
+
+    def __get_threadpool(self, num_requests):
+        """ returns the thread pool for state queries; it is created on first use and 
+            grows with the number of concurrent requests up to STATE_QUERY_THREADS """
+        num_workers = min(STATE_QUERY_THREADS, num_requests)
+        if self.threadpool == None:
+            self.threadpool = ThreadPool(num_workers)
+        elif len(self.threadpool.workers) < num_workers:
+            self.threadpool.createWorkers(num_workers - len(self.threadpool.workers))
+        return self.threadpool
     
     def get_blob_as_string(self, blob_name):
         return self.blob.get_blob(self.app_id, blob_name)
@@ -252,11 +394,8 @@ class bigjob_azure():
         pass
     
     def create_jd_json(self, jd):
-        jd_dict = {}
-        for i in dir(jd):          
-              if not str(i).startswith("__"):
-                  logging.debug("Add attribute: " + str(i) + " Value: " + str(getattr(jd, i)))              
-                  jd_dict[i]=getattr(jd, i)
+        jd_dict = {i: getattr(jd, i) for i in dir(jd) if not i.startswith("__")}
+        logging.debug("Add attributes: %s", jd_dict)
         
         #attributes = jd.list_attributes()                
         #for i in attributes:          
@@ -267,14 +406,21 @@ class bigjob_azure():
               #     jd_dict[i] = jd.get_attribute(i)
         # state should be stored as metadata to avoid that the entire blob must
         # be read (not supported by winazurestorage yet)
-        jd_dict["state"] = str(state.Unknown)       
+        jd_dict["state"] = state.Unknown
         return jd_dict
 
     def __repr__(self):
         return self.pilot_url 
 
-    def __del__(self):
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        """ cancel the bigjob explicitly when leaving a with block: the 
+            deployment teardown takes minutes and must not run on garbage 
+            collection or interpreter shutdown (no __del__) """
         self.cancel()
+        return False
 
                    
                     
@@ -313,9 +459,6 @@ class subjob():
         """ return stdout of subjob as string """
         return self.bigjob.get_blob_as_string(self.job_jd.output + "-" +self.job_id)
 
-    def __del__(self):
-        self.bigjob.delete_subjob(self.job_id)
-    
     def __repr__(self):        
         if(self.job_url==None):
             return "None"
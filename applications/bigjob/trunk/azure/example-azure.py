@@ -54,8 +54,9 @@ if __name__ == "__main__":
     while 1:
         try:
             number_done = 0
+            states = bj.get_all_subjob_states([i.job_id for i in jobs])
             for i in jobs:
-                state = str(i.get_state())
+                state = str(states[i.job_id])
                 print "job: " + str(i) + " state: " + str(state) + " Time passed: " + str(time.time()-start) + " sec"    
                 if(state=="Failed" or state=="Done"):
                     number_done = number_done + 1                    
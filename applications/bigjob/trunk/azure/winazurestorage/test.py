@@ -1,4 +1,5 @@
 from winazurestorage import *
+import BaseHTTPServer
 
 def do_blob_tests():
     '''Expected output:
@@ -17,8 +18,119 @@ def do_blob_tests():
     print "\tdelete_container: %d" % blobs.delete_container("testcontainer")
     print "Done."
 
+class PoolTestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''Local HTTP/1.1 server for the connection pool tests:
+        /<account>/testcontainer/testblob.txt -> blob with etag "0x1" (304 if matched)
+        /<account>/close-after                -> closes the connection after the response
+        anything else                         -> 404'''
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    requests = 0
+    last_path = None
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        PoolTestHandler.connections += 1
+
+    def _respond(self, code, body = "", headers = {}):
+        self.send_response(code)
+        for (k, v) in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        PoolTestHandler.requests += 1
+        PoolTestHandler.last_path = self.path
+        if self.path.endswith("/testcontainer/testblob.txt"):
+            if self.headers.get("If-None-Match") == '"0x1"':
+                self.send_response(304)
+                self.send_header("ETag", '"0x1"')
+                self.end_headers()
+            else:
+                self._respond(200, "Hello, World!", {"ETag": '"0x1"'})
+        elif self.path.endswith("/close-after"):
+            self._respond(200, "bye")
+            self.close_connection = 1
+        else:
+            self._respond(404)
+
+    def do_POST(self):
+        PoolTestHandler.requests += 1
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._respond(201)
+
+    def log_message(self, format, *args):
+        pass
+
+def do_connection_pool_tests():
+    '''Expected output (no storage account required):
+        Starting connection pool tests
+                keep-alive: 3 requests over 1 connection(s)
+                get_blob_if_none_match: data=None etag="0x1"
+                error code: 404
+                reused closed connection, GET: retried
+                reused closed connection, POST: not retried
+                proxy: get_blob: Hello, World! (absolute request URI: True)
+                proxy: get_blob_if_none_match: data=None
+        Done.
+    '''
+    print "Starting connection pool tests"
+    server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), PoolTestHandler)
+    server_thread = threading.Thread(target = server.serve_forever)
+    server_thread.setDaemon(True)
+    server_thread.start()
+    host = "127.0.0.1:%d" % server.server_address[1]
+    blobs = BlobStorage(host = host)
+    blobs._urlopen = ConnectionPool(timeout = 10).urlopen
+
+    for i in range(3):
+        blobs.get_blob("testcontainer", "testblob.txt")
+    print "\tkeep-alive: %d requests over %d connection(s)" % (PoolTestHandler.requests, PoolTestHandler.connections)
+
+    (data, etag) = blobs.get_blob_if_none_match("testcontainer", "testblob.txt", '"0x1"')
+    print "\tget_blob_if_none_match: data=%s etag=%s" % (data, etag)
+
+    try:
+        blobs.get_blob("testcontainer", "missing.txt")
+    except HTTPError, e:
+        print "\terror code: %d" % e.code
+
+    # the server closes the connection after /close-after without announcing it
+    url = "%s/close-after" % blobs.get_base_url()
+    blobs._urlopen(Request(url))
+    requests = PoolTestHandler.requests
+    blobs._urlopen(Request(url))
+    print "\treused closed connection, GET: %s" % (PoolTestHandler.requests == requests + 1 and "retried" or "failed")
+    requests = PoolTestHandler.requests
+    try:
+        blobs._urlopen(Request(url, "message"))
+        print "\treused closed connection, POST: retried"
+    except URLError:
+        print "\treused closed connection, POST: %s" % (PoolTestHandler.requests == requests and "not retried" or "failed")
+
+    # with http_proxy set, requests go through urllib2 (the test server acts as proxy)
+    saved_environ = dict(os.environ)
+    for k in ("no_proxy", "NO_PROXY"):
+        os.environ.pop(k, None)
+    os.environ["http_proxy"] = "http://%s" % host
+    try:
+        proxied_blobs = BlobStorage(host = "storage.invalid:10000")
+        proxied_blobs._urlopen = ConnectionPool(timeout = 10).urlopen
+        data = proxied_blobs.get_blob("testcontainer", "testblob.txt")
+        print "\tproxy: get_blob: %s (absolute request URI: %s)" % (data, PoolTestHandler.last_path.startswith("http://storage.invalid:10000/"))
+        (data, etag) = proxied_blobs.get_blob_if_none_match("testcontainer", "testblob.txt", '"0x1"')
+        print "\tproxy: get_blob_if_none_match: data=%s" % data
+    finally:
+        os.environ.clear()
+        os.environ.update(saved_environ)
+    server.shutdown()
+    print "Done."
+
 def run_tests():
+    do_connection_pool_tests()
     do_blob_tests()
 
 if __name__ == '__main__':
-    run_tests()
\ No newline at end of file
+    run_tests()
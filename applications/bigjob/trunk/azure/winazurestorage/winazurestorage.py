@@ -14,7 +14,12 @@ import sys
 import os
 from xml.dom import minidom #TODO: Use a faster way of processing XML
 import re
-from urllib2 import Request, urlopen, URLError
+import socket
+import httplib
+import threading
+import urllib
+import urllib2
+from urllib2 import Request, URLError, HTTPError
 from urlparse import urlsplit
 from datetime import datetime, timedelta
 
@@ -103,6 +108,118 @@ class RequestWithMethod(Request):
     def get_method(self):
         return self._method
 
+class PersistentResponse(object):
+    '''Fully read HTTP response, so that the underlying connection can be reused
+       for the next request. Provides the subset of the urllib2 response interface
+       used by this module.'''
+    def __init__(self, url, response):
+        self.url = url
+        self.code = response.status
+        self.msg = response.reason
+        self.headers = response.msg
+        self._data = response.read()
+
+    def read(self):
+        return self._data
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self.url
+
+class ConnectionPool(object):
+    '''Keeps persistent (keep-alive) HTTP connections per host and thread.
+       Consecutive requests to the same storage host reuse the TCP connection
+       instead of opening a new one per call, as urllib2.urlopen does.
+       Requests which have to go through a proxy (http_proxy/https_proxy) are 
+       passed to urllib2.urlopen.'''
+
+    # methods which may be re-sent if a kept-alive connection turns out to be closed
+    IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "DELETE"))
+    # non-idempotent requests (e.g. put_message) are not re-sent, therefore they do
+    # not reuse connections which have been idle for longer than this (in s) 
+    MAX_IDLE_TIME = 5
+
+    def __init__(self, timeout = None):
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def _connections(self):
+        if not hasattr(self._local, "connections"):
+            self._local.connections = {}
+        return self._local.connections
+
+    def _get_connection(self, scheme, host, max_idle_time = None):
+        connections = self._connections()
+        key = (scheme, host)
+        if key in connections:
+            (connection, last_used) = connections[key]
+            if max_idle_time is None or time.time() - last_used <= max_idle_time:
+                return connection, True
+            self._drop_connection(scheme, host)
+        if scheme == "https":
+            connection = httplib.HTTPSConnection(host, timeout = self._timeout)
+        else:
+            connection = httplib.HTTPConnection(host, timeout = self._timeout)
+        connections[key] = (connection, time.time())
+        return connection, False
+
+    def _drop_connection(self, scheme, host):
+        entry = self._connections().pop((scheme, host), None)
+        if entry is not None:
+            entry[0].close()
+
+    def _urlopen_via_proxy(self, req):
+        try:
+            if self._timeout is None:
+                return urllib2.urlopen(req)
+            return urllib2.urlopen(req, timeout = self._timeout)
+        except HTTPError, e:
+            # urllib2 treats 304 as an error; the pool returns it as a response
+            if e.code == 304:
+                return e
+            raise
+
+    def urlopen(self, req):
+        '''Replacement for urllib2.urlopen: raises HTTPError for status codes >= 400.'''
+        (scheme, host, path, query, fragment) = urlsplit(req.get_full_url())
+        if scheme in urllib.getproxies() and not urllib.proxy_bypass(host):
+            return self._urlopen_via_proxy(req)
+        if query: path += "?" + query
+        method = req.get_method()
+        data = req.get_data()
+        headers = dict(req.header_items())
+        if data is not None and not req.has_header("Content-type"):
+            headers["Content-type"] = "application/x-www-form-urlencoded"
+        idempotent = method in self.IDEMPOTENT_METHODS
+        while True:
+            if idempotent:
+                (connection, reused) = self._get_connection(scheme, host)
+            else:
+                (connection, reused) = self._get_connection(scheme, host, self.MAX_IDLE_TIME)
+            try:
+                connection.request(method, path or "/", data, headers)
+                response = PersistentResponse(req.get_full_url(), connection.getresponse())
+                break
+            except (httplib.HTTPException, socket.error), e:
+                self._drop_connection(scheme, host)
+                # a kept-alive connection may have been closed by the server in the 
+                # meantime - retry once on a fresh connection. Non-idempotent requests
+                # are not retried, as the server may already have processed them
+                # (e.g. a re-sent put_message would queue the subjob twice)
+                if not reused or not idempotent:
+                    raise URLError(e)
+        if response.headers.get("connection", "").lower() == "close":
+            self._drop_connection(scheme, host)
+        else:
+            self._connections()[(scheme, host)] = (connection, time.time())
+        if response.code >= 400:
+            raise HTTPError(response.url, response.code, response.msg, response.headers, None)
+        return response
+
+CONNECTION_POOL = ConnectionPool()
+
 class Table(object):
     def __init__(self, url, name):
         self.url = url
@@ -117,6 +234,7 @@ class Storage(object):
             use_path_style_uris = re.match(r'^[^:]*[\d:]+$', self._host)
         self._use_path_style_uris = use_path_style_uris
         self._credentials = SharedKeyCredentials(self._account, self._key)
+        self._urlopen = CONNECTION_POOL.urlopen
 
     def get_base_url(self):
         if self._use_path_style_uris:
@@ -137,7 +255,7 @@ class QueueStorage(Storage):
         req.add_header("Content-Length", "0")
         self._credentials.sign_request(req)
         try:
-            response = urlopen(req)
+            response = self._urlopen(req)
             return response.code
         except URLError, e:
             return e.code
@@ -146,7 +264,7 @@ class QueueStorage(Storage):
         req = RequestWithMethod("DELETE", "%s/%s" % (self.get_base_url(), name))
         self._credentials.sign_request(req)
         try:
-            response = urlopen(req)
+            response = self._urlopen(req)
             return response.code
         except URLError, e:
             return e.code
@@ -158,24 +276,33 @@ class QueueStorage(Storage):
         req.add_header("Content-Length", len(data))
         self._credentials.sign_request(req)
         try:
-            response = urlopen(req)
+            response = self._urlopen(req)
             return response.code
         except URLError, e:
             return e.code
 
     def get_message(self, queue_name):
-        req = Request("%s/%s/messages" % (self.get_base_url(), queue_name))
+        messages = self.get_messages(queue_name)
+        if len(messages) == 1:
+            return messages[0]
+        return None
+
+    def get_messages(self, queue_name, numofmessages = 1, visibilitytimeout = None):
+        '''Retrieves up to numofmessages (max. 32) messages with a single request.'''
+        url = "%s/%s/messages?numofmessages=%d" % (self.get_base_url(), queue_name, numofmessages)
+        if visibilitytimeout is not None: url += "&visibilitytimeout=%d" % visibilitytimeout
+        req = Request(url)
         self._credentials.sign_request(req)
-        response = urlopen(req)
+        response = self._urlopen(req)
         dom = minidom.parseString(response.read())
-        messages = dom.getElementsByTagName("QueueMessage")
-        result = None
-        if len(messages) == 1:
-            message = messages[0]
-            result = QueueMessage()
-            result.id = message.getElementsByTagName("MessageId")[0].firstChild.data
-            result.pop_receipt = message.getElementsByTagName("PopReceipt")[0].firstChild.data
-            result.text = base64.decodestring(message.getElementsByTagName("MessageText")[0].firstChild.data)
+        result = []
+        for message in dom.getElementsByTagName("QueueMessage"):
+            queue_message = QueueMessage()
+            queue_message.id = message.getElementsByTagName("MessageId")[0].firstChild.data
+            queue_message.pop_receipt = message.getElementsByTagName("PopReceipt")[0].firstChild.data
+            queue_message.text = base64.decodestring(message.getElementsByTagName("MessageText")[0].firstChild.data)
+            result.append(queue_message)
+        dom.unlink()
         return result
 
     def delete_message(self, queue_name, message):
@@ -184,7 +311,7 @@ class QueueStorage(Storage):
         req = RequestWithMethod("DELETE", "%s/%s/messages/%s?popreceipt=%s" % (self.get_base_url(), queue_name, id, pop_receipt))
         self._credentials.sign_request(req)
         try:
-            response = urlopen(req)
+            response = self._urlopen(req)
             return response.code
         except URLError, e:
             return e.code
@@ -215,7 +342,7 @@ class TableStorage(Storage):
         req.add_header("Content-Type", "application/atom+xml")
         self._credentials.sign_table_request(req)
         try:
-            response = urlopen(req)
+            response = self._urlopen(req)
             return response.code
         except URLError, e:
             return e.code
@@ -224,7 +351,7 @@ class TableStorage(Storage):
         req = RequestWithMethod("DELETE", "%s/Tables('%s')" % (self.get_base_url(), name))
         self._credentials.sign_table_request(req)
         try:
-            response = urlopen(req)
+            response = self._urlopen(req)
             return response.code
         except URLError, e:
             return e.code
@@ -232,7 +359,7 @@ class TableStorage(Storage):
     def list_tables(self):
         req = Request("%s/Tables" % self.get_base_url())
         self._credentials.sign_table_request(req)
-        response = urlopen(req)
+        response = self._urlopen(req)
 
         dom = minidom.parseString(response.read())
         
@@ -244,7 +371,7 @@ class TableStorage(Storage):
         dom.unlink()
 
     def get_entity(self, table_name, partition_key, row_key):
-        dom = minidom.parseString(urlopen(self._credentials.sign_table_request(Request("%s/%s(PartitionKey='%s',RowKey='%s')" % (self.get_base_url(), table_name, partition_key, row_key)))).read())
+        dom = minidom.parseString(self._urlopen(self._credentials.sign_table_request(Request("%s/%s(PartitionKey='%s',RowKey='%s')" % (self.get_base_url(), table_name, partition_key, row_key)))).read())
         entity = self._parse_entity(dom.getElementsByTagName("entry")[0])
         dom.unlink()
         return entity
@@ -265,7 +392,7 @@ class TableStorage(Storage):
         return entity
 
     def get_all(self, table_name):
-        dom = minidom.parseString(urlopen(self._credentials.sign_table_request(Request("%s/%s" % (self.get_base_url(), table_name)))).read())
+        dom = minidom.parseString(self._urlopen(self._credentials.sign_table_request(Request("%s/%s" % (self.get_base_url(), table_name)))).read())
         entries = dom.getElementsByTagName("entry")
         entities = []
         for entry in entries:
@@ -283,7 +410,7 @@ class BlobStorage(Storage):
         if is_public: req.add_header(PREFIX_PROPERTIES + "publicaccess", "true")
         self._credentials.sign_request(req)
         try:
-            response = urlopen(req)
+            response = self._urlopen(req)
             return response.code
         except URLError, e:
             return e.code
@@ -292,7 +419,7 @@ class BlobStorage(Storage):
         req = RequestWithMethod("DELETE", "%s/%s" % (self.get_base_url(), container_name))
         self._credentials.sign_request(req)
         try:
-            response = urlopen(req)
+            response = self._urlopen(req)
             return response.code
         except URLError, e:
             return e.code
@@ -300,7 +427,7 @@ class BlobStorage(Storage):
     def list_containers(self):
         req = Request("%s/?comp=list" % self.get_base_url())
         self._credentials.sign_request(req)
-        dom = minidom.parseString(urlopen(req).read())
+        dom = minidom.parseString(self._urlopen(req).read())
         containers = dom.getElementsByTagName("Container")
         for container in containers:
             container_name = container.getElementsByTagName("Name")[0].firstChild.data
@@ -316,7 +443,7 @@ class BlobStorage(Storage):
         if content_type is not None: req.add_header("Content-Type", content_type)
         self._credentials.sign_request(req)
         try:
-            response = urlopen(req)
+            response = self._urlopen(req)
             return response.code
         except URLError, e:
             return e.code
@@ -324,7 +451,18 @@ class BlobStorage(Storage):
     def get_blob(self, container_name, blob_name):
         req = Request("%s/%s/%s" % (self.get_base_url(), container_name, blob_name))
         self._credentials.sign_request(req)
-        return urlopen(req).read()
+        return self._urlopen(req).read()
+
+    def get_blob_if_none_match(self, container_name, blob_name, etag = None):
+        '''Conditional get of a blob. Returns the tuple (data, etag); data is None
+           if the blob has not been modified since etag was returned (304).'''
+        req = Request("%s/%s/%s" % (self.get_base_url(), container_name, blob_name))
+        if etag is not None: req.add_header("If-None-Match", etag)
+        self._credentials.sign_request(req)
+        response = self._urlopen(req)
+        if response.code == 304:
+            return (None, etag)
+        return (response.read(), response.info().get("etag"))
 
 def main():
     pass
@@ -9,8 +9,10 @@ This Module is used to launch a set of jobs via a local Condor pool created usin
 import saga
 import time
 import uuid
+import itertools
 import socket
 import os
+import errno
 
 CONDOR_BIN = "/home/luckow/saga/condor_bin"     # local directory with condor_submit wrapper
 CONDOR_LOCATION = "/home/lukas/packages/condor-7.3.2"   # CONDOR_LOCATION on the remote site
@@ -19,6 +21,8 @@ class bigjob_condor():
 
     def __init__(self, database_host=None):
         self.uuid = uuid.uuid1()
+        # subjob ids are unique within this bigjob: <uuid>-<counter>
+        self.subjob_counter = itertools.count()
         self.state=saga.job.Unknown
         self.pilot_url=""
         self.glidein_jobs = {}
@@ -40,8 +44,11 @@ class bigjob_condor():
         image_name=None):
 
         print "Working directory: " + working_directory
-        if not os.path.isdir(working_directory):
-            os.mkdir(working_directory)
+        try:
+            os.makedirs(working_directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
 
         self.js_url = saga.url("condor://localhost/")
         self.job_service = saga.job.service(self.js_url)
@@ -52,24 +59,24 @@ class bigjob_condor():
         glidein_desc.output = "condor_glidein.$(CLUSTER).$(PROCESS).out"
         glidein_desc.error = "condor_glidein.$(CLUSTER).$(PROCESS).err"
 
-        glidein = open(glidein_desc.executable, "w")
-        glidein.write("#!/bin/bash -l\n")
-        glidein.write("/bin/date\n")
-        glidein.write("NODES=`uniq $PBS_NODEFILE`\n")
-        glidein.write("for i in $NODES; do\n")
-        glidein.write("ssh $i \"export CONDOR_LOCATION=" + CONDOR_LOCATION + ";")
-        glidein.write("source " + CONDOR_LOCATION + "/condor.sh;")
-        glidein.write("condor_master\"\n")
-        glidein.write("done\n")
-        glidein.write("sleep " + str(60*walltime) + "\n")
-        glidein.close()
-
-        attr = open(CONDOR_BIN + "/condor_attr", "w")
-        attr.write("universe = grid\n")
-        attr.write("grid_resource = gt2 " + lrms_url + "\n")
-        attr.write("globus_rsl = (project=" + project + ")(maxWallTime=" + str(walltime) + ")(hostCount=" + str(number_nodes) + ")(jobType=single)(queue=" + queue + ")\n")
-        attr.write("x509userproxy = " + userproxy + "\n")
-        attr.close()
+        glidein_lines = [
+            "#!/bin/bash -l",
+            "/bin/date",
+            "NODES=`uniq $PBS_NODEFILE`",
+            "for i in $NODES; do",
+            "ssh $i \"export CONDOR_LOCATION={0};source {0}/condor.sh;condor_master\"".format(CONDOR_LOCATION),
+            "done",
+            "sleep {0}".format(60*walltime)]
+        with open(glidein_desc.executable, "w") as glidein:
+            glidein.write("\n".join(glidein_lines) + "\n")
+
+        attr_lines = [
+            "universe = grid",
+            "grid_resource = gt2 {0}".format(lrms_url),
+            "globus_rsl = (project={0})(maxWallTime={1})(hostCount={2})(jobType=single)(queue={3})".format(project, walltime, number_nodes, queue),
+            "x509userproxy = {0}".format(userproxy)]
+        with open(CONDOR_BIN + "/condor_attr", "w") as attr:
+            attr.write("\n".join(attr_lines) + "\n")
 
         glidein_job = self.job_service.create_job(glidein_desc)
         glidein_job.run()
@@ -79,9 +86,10 @@ class bigjob_condor():
         return glidein_job_id
 
     def get_state(self, glidein_job_id):
-        if self.glidein_jobs.has_key(str(glidein_job_id)):
-            return self.glidein_jobs[str(glidein_job_id)].get_state()
-        return None
+        glidein_job = self.glidein_jobs.get(str(glidein_job_id))
+        if glidein_job is None:
+            return None
+        return glidein_job.get_state()
 
     ################################################################################
     # get_state methods for compatability with standard BigJob
@@ -95,9 +103,10 @@ class bigjob_condor():
         return None
 
     def cancel(self, glidein_job_id):
-        if self.glidein_jobs.has_key(str(glidein_job_id)):
-            return self.glidein_jobs[str(glidein_job_id)].cancel()
-        return None
+        glidein_job = self.glidein_jobs.get(str(glidein_job_id))
+        if glidein_job is None:
+            return None
+        return glidein_job.cancel()
     
     def cancel(self):
         for id, job in self.glidein_jobs.iteritems():
@@ -105,7 +114,7 @@ class bigjob_condor():
     
     def add_subjob(self, jd):
         print "add subjob to list"
-        job_id = uuid.uuid1()
+        job_id = "%s-%d"%(self.uuid, self.subjob_counter.next())
         sj = self.job_service.create_job(jd)
         job_dict = {}
         job_dict["job_description"] = jd
@@ -117,18 +126,16 @@ class bigjob_condor():
 
     def get_state_of_subjob(self, job_id):
         """ returns state of specified subjob"""
-        if self.subjobs.has_key(str(job_id)):
-            job_dict = self.subjobs[str(job_id)]
-            saga_job = job_dict["saga_job"]
-            return saga_job.get_state()
-        return None
+        job_dict = self.subjobs.get(str(job_id))
+        if job_dict is None:
+            return None
+        return job_dict["saga_job"].get_state()
 
     def cancel_subjob(self, job_id):
-        if self.subjobs.has_key(str(job_id)):
-            job_dict = self.subjobs[str(job_id)]
-            saga_job = job_dict["saga_job"]
-            return saga_job.cancel()
-        return None
+        job_dict = self.subjobs.get(str(job_id))
+        if job_dict is None:
+            return None
+        return job_dict["saga_job"].cancel()
 
     def __del__(self):
         self.cancel()
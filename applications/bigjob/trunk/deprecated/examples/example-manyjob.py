@@ -14,6 +14,7 @@ import pdb
 import os
 import traceback
 import logging
+from collections import Counter
 
 
 # BigJob implementation can be swapped here by importing another implementation,
@@ -32,13 +33,13 @@ import many_job
 
     
 NUMBER_JOBS=8
+# bounds of the adaptive polling interval (in s)
+MIN_POLL_INTERVAL=0.25
+MAX_POLL_INTERVAL=10.0
+
 
 def has_finished(state):
-        state = state.lower()
-        if state=="done" or state=="failed" or state=="canceled":
-            return True
-        else:
-            return False
+        return state in many_job.FINISHED_STATES
 
 """ Test Job Submission via ManyJob abstraction """
 if __name__ == "__main__":
@@ -63,9 +64,9 @@ if __name__ == "__main__":
         print "Create manyjob service "
         mjs = many_job.many_job_service(resource_list, "advert.cct.lsu.edu")
         
+        # per sub-job data is kept in parallel lists indexed by sub-job number
         jobs = []
-        job_start_times = {}
-        job_states = {}
+        job_start_times = []
         cwd = os.getcwd()
         for i in range(0, NUMBER_JOBS):
             # create job description
@@ -81,26 +82,25 @@ if __name__ == "__main__":
             subjob.run()
             print "Submited sub-job " + "%d"%i + "."
             jobs.append(subjob)
-            job_start_times[subjob]=time.time()
-            job_states[subjob] = subjob.get_state()
+            job_start_times.append(time.time())
+        job_states = mjs.get_states(jobs)
         print "************************ All Jobs submitted ************************"
+        poll_interval = 0.5
         while 1: 
-            finish_counter=0
-            result_map = {}
-            for i in range(0, NUMBER_JOBS):
-                old_state = job_states[jobs[i]]
-                state = jobs[i].get_state()
-                if result_map.has_key(state) == False:
-                    result_map[state]=0
-                result_map[state] = result_map[state]+1
-                #print "counter: " + str(i) + " job: " + str(jobs[i]) + " state: " + state
+            state_changed = False
+            states = mjs.get_states(jobs)
+            result_map = Counter(states)
+            finish_counter = sum(result_map[state] for state in result_map if has_finished(state))
+            for idx, job in enumerate(jobs):
+                old_state = job_states[idx]
+                state = states[idx]
+                #print "job: " + str(job) + " state: " + state
                 if old_state != state:
-                    print "Job " + str(jobs[i]) + " changed from: " + old_state + " to " + state
-                if old_state != state and has_finished(state)==True:
-                     print "Job: " + str(jobs[i]) + " Runtime: " + str(time.time()-job_start_times[jobs[i]]) + " s."
-                if has_finished(state)==True:
-                     finish_counter = finish_counter + 1
-                job_states[jobs[i]]=state
+                    state_changed = True
+                    print "Job " + str(job) + " changed from: " + old_state + " to " + state
+                    if has_finished(state):
+                        print "Job: " + str(job) + " Runtime: " + str(time.time()-job_start_times[idx]) + " s."
+            job_states = states
                 
             # Dynamic BigJob add resources at runtime
             # if more than 30 s - add additional resource
@@ -117,8 +117,13 @@ if __name__ == "__main__":
                     mjs.remove_resource(bj_list[0])
                 remove_additional_resources=False
                 
-            print "Current states: " + str(result_map) 
-            time.sleep(5)
+            print "Current states: " + str(dict(result_map)) 
+            # poll more frequently while states change, back off otherwise
+            if state_changed:
+                poll_interval = max(MIN_POLL_INTERVAL, poll_interval*0.7)
+            else:
+                poll_interval = min(MAX_POLL_INTERVAL, poll_interval*1.5)
+            time.sleep(poll_interval)
             if finish_counter == NUMBER_JOBS:
                 break
 
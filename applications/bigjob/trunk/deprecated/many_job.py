@@ -23,12 +23,22 @@ import time
 import math
 import operator
 import copy
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../ext/threadpool-1.2.7/src/")
+from threadpool import *
 
 # Log everything, and send it to stderr.
 logging.basicConfig(level=logging.DEBUG)
 
 DEFAULT_ADVERT_HOST="advert.cct.lsu.edu"
 
+# sub-job states (in all observed casings) that indicate termination
+FINISHED_STATES=frozenset(("done", "failed", "canceled", 
+                           "Done", "Failed", "Canceled", 
+                           "DONE", "FAILED", "CANCELED"))
+
+# number of concurrent state queries issued by get_states
+STATE_QUERY_THREADS=64
+
 class many_job_service(object):
 
     def __init__(self, bigjob_list, advert_host):
@@ -65,6 +75,9 @@ class many_job_service(object):
         # last queue Size
         self.last_queue_size = 0
         self.submisssion_times=[]
+        
+        # thread pool for concurrent sub-job state queries (created on first use)
+        self.threadpool = None
 
     def __init_bigjobs(self):
         """ start on specified resources a bigjob """
@@ -131,7 +144,7 @@ class many_job_service(object):
             if i["to_be_terminated"]==True:
                 bj = i["bigjob"]
                 total_cores = int(i["processes_per_node"])*int(i["number_nodes"])
-                if  i["free_cores"]==total_cores and not i.has_key("bj_stopped"):
+                if  i["free_cores"]==total_cores and "bj_stopped" not in i:
                     logging.debug("***Stop BigJob: " + str(bj.pilot_url))
                     # release resources of pilot job
                     bj.stop_pilot_job()
@@ -155,6 +168,31 @@ class many_job_service(object):
         subjob = sub_job(self, job_description, self.advert_host)        
         return subjob
 
+    def get_states(self, subjobs):
+        """ returns list with the states of the specified sub-jobs (in the same order)
+            the states are queried concurrently via the thread pool """
+        states = [None]*len(subjobs)
+        if len(subjobs) == 0:
+            return states
+        def store_state(request, result):
+            states[request.requestID] = result
+        threadpool = self.__get_threadpool(len(subjobs))
+        for index, i in enumerate(subjobs):
+            threadpool.putRequest(WorkRequest(sub_job.get_state, [i], requestID=index, 
+                                              callback=store_state))
+        threadpool.wait()
+        return states
+
+    def __get_threadpool(self, num_requests):
+        """ returns the thread pool for state queries; it is created on first use and 
+            grows with the number of concurrent requests up to STATE_QUERY_THREADS """
+        num_workers = min(STATE_QUERY_THREADS, num_requests)
+        if self.threadpool == None:
+            self.threadpool = ThreadPool(num_workers)
+        elif len(self.threadpool.workers) < num_workers:
+            self.threadpool.createWorkers(num_workers - len(self.threadpool.workers))
+        return self.threadpool
+
     def __run_subjob(self, subjob):
         # select appropriate bigjob
         bigjob_info = self.__schedule_subjob(subjob)
@@ -220,7 +258,7 @@ class many_job_service(object):
         
     def __free_resources(self, subjob):
         """free resources taken by subjob"""
-        if(self.subjob_bigjob_dict.has_key(subjob)):
+        if subjob in self.subjob_bigjob_dict:
             logging.debug("job: " + str(subjob) + " done - free resources")
             bigjob = self.subjob_bigjob_dict[subjob]
             lock = bigjob["lock"]
@@ -278,6 +316,9 @@ class many_job_service(object):
         # put object in queue to unlock the get() operation
         self.subjob_queue.put("dummy")
         self.rescheduler_thread.join()        
+        if self.threadpool != None:
+            self.threadpool.dismissWorkers(len(self.threadpool.workers), do_join=True)
+            self.threadpool = None
         logging.debug("Cancel many-job: kill all bigjobs")
         for i in self.bigjob_list:
             bigjob = i["bigjob"]
@@ -297,11 +338,7 @@ class many_job_service(object):
         print description + " Average: " + str(mean) + " Stdev: " + str(variance)
         
     def __has_finished(self, state):
-        state = state.lower()
-        if state=="done" or state=="failed" or state=="canceled":
-            return True
-        else:
-            return False
+        return state in FINISHED_STATES
 
     def __repr__(self):
         return str(self.uuid)
@@ -363,7 +400,7 @@ class sub_job():
             try:
                 state = self.get_state()
                 logging.debug("wait: state: " + state)
-                if self.__has_finished(state) == True:
+                if state in FINISHED_STATES:
                     break
                 time.sleep(2)
             except (KeyboardInterrupt, SystemExit):
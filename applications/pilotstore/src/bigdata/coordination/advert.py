@@ -200,7 +200,10 @@ class AdvertCoordinationAdaptor:
         ps_urls = [i.url for i in pd.pilot_stores]
         cls.__store_entry(cls.__remove_dbtype(pd.url)+"/pilot-stores", ps_urls)
                 
-        du_dict_list = [i.to_dict() for i in pd.data_units]
+        # note: "url" has been added to the stored DU dicts (previously only id and 
+        # local_url were stored, as url is a slot of the DataUnit base class)
+        du_dict_list = [{"id":i, "local_url":l, "url":u} 
+                        for i, l, u in zip(pd.ids(), pd.local_urls(), pd.urls())]
         cls.__store_entry(cls.__remove_dbtype(pd.url)+"/data-units", du_dict_list)
         
        
@@ -11,12 +11,13 @@ import threading
 import time
 import pdb
 import Queue
+from contextlib import contextmanager
 
 
 import saga
 sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
 
-from bigdata.troy.data.api import PilotData, DataUnit, PilotDataService
+from bigdata.troy.data.api import PilotData, DataUnit, PilotDataService, PilotDataDescription
 from bigdata.troy.compute.api import State
 from bigdata.manager.pilotstore_manager import *
 from bigdata.scheduler.random_scheduler import Scheduler
@@ -42,13 +43,22 @@ class PilotData(PilotData):
             2.) reconnect to an existing Pilot Data: pd_url required 
             
         """
+        # nesting level of batch() blocks and whether an update was deferred
+        self.batch_level = 0
+        self.update_pending = False
+        # data units are stored as parallel lists (see list_data_units())
+        self._ids = []
+        self._local_urls = []
+        self._urls = []
         if pd_url==None:
             self.id = self.PD_ID_PREFIX + str(uuid.uuid1())
+            if isinstance(pilot_data_description, PilotDataDescription):
+                pilot_data_description = pilot_data_description.to_dict()
             self.pilot_data_description = pilot_data_description        
             self.pilot_stores=[]
             self.url = CoordinationAdaptor.add_pd(pilot_data_service.url, self)
             self.state = State.New
-            self.data_units = DataUnit.create_data_unit_list(self, self.pilot_data_description["file_urls"]) 
+            self.__append_data_units(DataUnit.create_data_unit_list(self, self.pilot_data_description["file_urls"]))
             CoordinationAdaptor.update_pd(self)
         else:
             self.id = self.__get_pd_id(pd_url)
@@ -60,8 +70,10 @@ class PilotData(PilotData):
         pd_dict = CoordinationAdaptor.get_pd(self.url)
         self.pilot_data_description = pd_dict["pilot_data_description"]
         self.state = pd_dict["state"]
-        data_unit_dict_list = pd_dict["data_units"]
-        self.data_units = [DataUnit.create_data_unit_from_dict(i) for i in data_unit_dict_list]
+        for i in pd_dict["data_units"]:
+            self._ids.append(i.get("id"))
+            self._local_urls.append(i.get("local_url"))
+            self._urls.append(i.get("url"))
         self.pilot_stores = [] 
         for i in pd_dict["pilot_stores"]:
             logger.debug("PS:"+str(i)) 
@@ -72,22 +84,77 @@ class PilotData(PilotData):
     def cancel(self):
         """ Cancel the PD. """
         self.state = State.Done    
-        CoordinationAdaptor.update_pd(self)
+        self.__update()
             
     def add_data_unit(self, data_unit):
-        self.data_units.append(data_unit)    
-        CoordinationAdaptor.update_pd(self)
+        self.add_data_units([data_unit])
+        
+        
+    def add_data_units(self, data_units):
+        """ add a list of data units with a single update of the coordination service """
+        self.__append_data_units(data_units)
+        self.__update()
         # TODO Update Pilot Stores
         
         
     def remove_data_unit(self, data_unit):
-        self.data_units.remove(data_unit)
-        CoordinationAdaptor.update_pd(self)
+        self.remove_data_units([data_unit])
+        
+        
+    def remove_data_units(self, data_units):
+        """ remove a list of data units with a single update of the coordination service """
+        remove_ids = set(i.id for i in data_units)
+        keep = [j for j, du_id in enumerate(self._ids) if du_id not in remove_ids]
+        self._ids = [self._ids[j] for j in keep]
+        self._local_urls = [self._local_urls[j] for j in keep]
+        self._urls = [self._urls[j] for j in keep]
+        self.__update()
         # TODO Update Pilot Stores
         
         
+    @contextmanager
+    def batch(self):
+        """ defer updates of the coordination service until the end of the block:
+        
+            with pd.batch():
+                pd.add_data_unit(du1)
+                pd.remove_data_unit(du2)
+                
+            results in a single update of the PD in the coordination service 
+        """
+        self.batch_level += 1
+        try:
+            yield self
+        finally:
+            self.batch_level -= 1
+            if self.batch_level == 0 and self.update_pending:
+                self.update_pending = False
+                CoordinationAdaptor.update_pd(self)
+        
+        
     def list_data_units(self):        
-        return self.data_units
+        """ returns a view of the data units; DataUnit objects are only 
+            created when the view is iterated or indexed 
+        """
+        return DataUnitList(self)
+    
+    # backwards compatible attribute access
+    data_units = property(list_data_units)
+    
+    
+    def ids(self):
+        """ list of the IDs of all data units """
+        return self._ids
+    
+    
+    def local_urls(self):
+        """ list of the local (source) URLs of all data units (same order as ids()) """
+        return self._local_urls
+    
+    
+    def urls(self):
+        """ list of the URLs of all data units (same order as ids()) """
+        return self._urls
         
     
     def get_state(self):        
@@ -103,7 +170,7 @@ class PilotData(PilotData):
         else: # copy files from original location
             pilot_store.put_pd(self)
         self.pilot_stores.append(pilot_store)
-        CoordinationAdaptor.update_pd(self)  
+        self.__update()
         
     
     def get_pilot_stores(self):
@@ -130,7 +197,22 @@ class PilotData(PilotData):
     # BigData Internal Methods
     def update_state(self, state):
         self.state=state
-        CoordinationAdaptor.update_pd(self)
+        self.__update()
+        
+    
+    def __append_data_units(self, data_units):
+        for i in data_units:
+            self._ids.append(i.id)
+            self._local_urls.append(getattr(i, "local_url", None))
+            self._urls.append(getattr(i, "url", None))
+    
+    
+    def __update(self):
+        """ update PD in coordination service (deferred inside of a batch() block) """
+        if self.batch_level > 0:
+            self.update_pending = True
+        else:
+            CoordinationAdaptor.update_pd(self)
 
     
     def __get_pd_id(self, pd_url):
@@ -225,6 +307,42 @@ class DataUnit(DataUnit):
         return du
     
     
+class DataUnitList(object):
+    """ Read-only view of the data units of a PilotData. 
+    
+        The PilotData keeps its data units as parallel lists of ids and URLs.
+        DataUnit objects are only created on demand by iterating/indexing 
+        the view. Each access returns a new DataUnit object, therefore DUs are 
+        compared by id (e.g. "du in pd.list_data_units()"). For bulk access 
+        use PilotData.ids()/urls() instead.
+    """
+    
+    def __init__(self, pd):
+        self.pd = pd
+        
+    def __len__(self):
+        return len(self.pd._ids)
+    
+    def __iter__(self):
+        for j in xrange(len(self.pd._ids)):
+            yield self[j]
+    
+    def __contains__(self, data_unit):
+        return getattr(data_unit, "id", None) in self.pd._ids
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[j] for j in xrange(*index.indices(len(self)))]
+        du = DataUnit()
+        du.id = self.pd._ids[index]
+        du.local_url = self.pd._local_urls[index]
+        du.url = self.pd._urls[index]
+        return du
+    
+    def __repr__(self):
+        return str(list(self))
+    
+    
 
     
 ###############################################################################
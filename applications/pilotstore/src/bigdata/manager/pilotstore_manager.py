@@ -17,7 +17,7 @@ from bigdata.coordination.advert import AdvertCoordinationAdaptor as Coordinatio
 
 
 
-from bigdata.troy.data.api import PilotStore, PilotStoreService
+from bigdata.troy.data.api import PilotStore, PilotStoreService, PilotStoreDescription
 
 
 class PilotStore(PilotStore):
@@ -45,6 +45,8 @@ class PilotStore(PilotStore):
         
         if ps_url==None and pilot_store_service!=None:      # new ps          
             self.id = self.PS_ID_PREFIX+str(uuid.uuid1())
+            if isinstance(pilot_store_description, PilotStoreDescription):
+                pilot_store_description = pilot_store_description.to_dict()
             self.pilot_store_description = pilot_store_description
             self.url = CoordinationAdaptor.add_ps(CoordinationAdaptor.get_base_url(bigdata.application_id)+"/"+pilot_store_service.id, self)
         elif ps_url != None:
@@ -91,7 +93,7 @@ class PilotStore(PilotStore):
         
         
     def url_for_pd(self, pd):
-        if self.pilot_data.has_key(pd.id):
+        if pd.id in self.pilot_data:
             return self.service_url + "/" + str(pd.id)
         return None
     
@@ -110,7 +112,7 @@ class PilotStore(PilotStore):
         
     def remove_pd(self, pd):
         """ Remove pilot data from pilot store """
-        if self.pilot_data.has_key(pd.id):
+        if pd.id in self.pilot_data:
             self.__filemanager.remove_pd(pd)
             del self.pilot_data[pd.id]
         CoordinationAdaptor.update_ps(self)
@@ -167,7 +169,7 @@ class PilotStoreService(PilotStoreService):
         'id',             # Reference to this PJS
         'url',            # URL for referencing PilotStoreService
         'state',          # Status of the PJS
-        'pilot_stores'    # List of PJs under this PJS
+        'pilot_stores',   # List of PJs under this PJS
         'affinity_list'   # List of PS on that are affine to each other
     )
 
@@ -178,6 +180,8 @@ class PilotStoreService(PilotStoreService):
             pss_id -- restore from pss_id
         """        
         self.pilot_stores={}
+        self.state = None
+        self.affinity_list = []
         
         if pss_url == None:
             self.id = self.PSS_ID_PREFIX + str(uuid.uuid1())
@@ -185,6 +189,7 @@ class PilotStoreService(PilotStoreService):
             self.url = CoordinationAdaptor.add_pss(application_url, self)
         else:
             self.id = self.__get_pss_id(pss_url)
+            self.url = pss_url
     
     
     def __get_pss_id(self, pss_url):
@@ -219,9 +224,7 @@ class PilotStoreService(PilotStoreService):
     
     
     def get_pilotstore(self, ps_id):
-        if self.pilot_stores.has_key(ps_id):
-            return self.pilot_stores[ps_id]
-        return None
+        return self.pilot_stores.get(ps_id)
 
 
     def list_pilotstores(self):
@@ -243,8 +246,9 @@ class PilotStoreService(PilotStoreService):
  
     
     def to_dict(self):
-        pss_dict = self.__dict__
+        pss_dict = {}
         pss_dict["id"]=self.id
+        pss_dict["url"]=self.url
         return pss_dict
  
  
@@ -4,6 +4,11 @@ It is not supposed to be used directly by applications.
 """
 
 class State(object):
+    """ States of TROY objects. 
+    
+        The values are (interned) string constants: they are compared by value,
+        are readable in logs and are stored as-is in the coordination service.
+    """
     Unknown = "Unknown"
     New = "New"
     Running = "Running"
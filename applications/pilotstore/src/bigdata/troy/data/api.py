@@ -2,7 +2,7 @@
 This file contains the API for the (proposed) TROY PilotData Framework.
 """
     
-class PilotStoreDescription(dict):
+class PilotStoreDescription(object):
     """ TROY PilotStoreDescription.
         {
             'service_url': "ssh://localhost/tmp/pilotstore/",
@@ -13,17 +13,26 @@ class PilotStoreDescription(dict):
             'affinity_machine_label',       # pilot stores sharing the same label are located on the same machine                           
         }    
     """
+
+    # Class members
+    __slots__ = (
+        'service_url',                  # URL of the storage backend
+        'size',                         # Size of the PilotStore
+        'affinity_datacenter_label',    # Data center affinity label
+        'affinity_machine_label',       # Machine affinity label
+    )
     
-    def __init__(self):
-        pass
+    def __init__(self, service_url=None, size=None, 
+                 affinity_datacenter_label=None, affinity_machine_label=None):
+        self.service_url = service_url
+        self.size = size
+        self.affinity_datacenter_label = affinity_datacenter_label
+        self.affinity_machine_label = affinity_machine_label
     
 
-    def __setattr__(self, attr, value):
-        self[attr]=value
-        
-    
-    def __getattr__(self, attr):
-        return self[attr]
+    def to_dict(self):
+        """ Returns the description in its dictionary form (unset fields are omitted) """
+        return dict((i, getattr(self, i)) for i in self.__slots__ if getattr(self, i) != None)
 
 
 
@@ -50,6 +59,9 @@ class PilotStore(object):
     
     
     def get_state(self):
+        """ Return value: 
+            State of the PilotStore (a State value)
+        """
         pass
     
        
@@ -170,7 +182,7 @@ class PilotDataService(object):
 #
 # TROY PilotDataDescription
 # 
-class PilotDataDescription(dict):
+class PilotDataDescription(object):
     """ TROY PilotDataDescription.
         {
             'file_urls': [file1, file2, file3]        
@@ -179,14 +191,22 @@ class PilotDataDescription(dict):
         Currently, no directories supported
     """
 
-    def __init__(self):
-        pass
+    # Class members
+    __slots__ = (
+        'file_urls',                    # List of file URLs
+        'affinity_datacenter_label',    # Data center affinity label
+        'affinity_machine_label',       # Machine affinity label
+    )
 
-    def __setattr__(self, attr, value):
-        self[attr]=value
-    
-    def __getattr__(self, attr):
-        return self[attr]
+    def __init__(self, file_urls=None, 
+                 affinity_datacenter_label=None, affinity_machine_label=None):
+        self.file_urls = file_urls
+        self.affinity_datacenter_label = affinity_datacenter_label
+        self.affinity_machine_label = affinity_machine_label
+
+    def to_dict(self):
+        """ Returns the description in its dictionary form (unset fields are omitted) """
+        return dict((i, getattr(self, i)) for i in self.__slots__ if getattr(self, i) != None)
     
     
 #
@@ -201,7 +221,9 @@ class PilotData(object):
         'id',               # Reference 
         'description',      # Description
         'state',            # State
-        'data_units'        # DU managed by PilotData object
+        '_ids',             # IDs of the DUs managed by PilotData object
+        '_local_urls',      # Local (source) URLs of the DUs (parallel to _ids)
+        '_urls'             # URLs of the DUs (parallel to _ids)
     )
 
     def cancel(self):
@@ -216,6 +238,18 @@ class PilotData(object):
     
     def list_data_units(self):
         pass
+    
+    def ids(self):
+        """ List of the IDs of all data units """
+        pass
+    
+    def local_urls(self):
+        """ List of the local (source) URLs of all data units (same order as ids()) """
+        pass
+    
+    def urls(self):
+        """ List of the URLs of all data units (same order as ids()) """
+        pass
         
     def get_state(self):
         """
@@ -224,6 +258,9 @@ class PilotData(object):
                 Pending => Files are synchronized with a pilot store
                 Running => PD is in sync with all replicas
                 Done => Terminated
+                
+            Return value:
+            A State value
         """
         pass
     